@@ -2,15 +2,106 @@
 # Chainlit-based front-end for the simple SD/DS chatbot KB
 # Run with: chainlit run app.py
 
+import asyncio
+import functools
 import json
 import os
+import re
 import difflib
 import textwrap
 import chainlit as cl
 
+# RapidFuzz provides a native implementation of the same ratio-style string
+# metric as difflib.SequenceMatcher; use it when available, fall back to
+# difflib otherwise.
+try:
+    from rapidfuzz.fuzz import ratio as _rf_ratio
+    from rapidfuzz import process as _rf_process
+except ImportError:
+    _rf_ratio = None
+    _rf_process = None
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+# orjson is a much faster drop-in for kb.json encode/decode; keep stdlib
+# json as the fallback.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit as _njit
+except ImportError:
+    _njit = None
+
+
+def _ratcliff_obershelp(a, b):
+    """Ratcliff-Obershelp similarity of two strings in [0, 1], matching
+    SequenceMatcher(autojunk=False).ratio(). Written iteratively with flat
+    loops (explicit stack, no dicts of lists) so numba can compile it."""
+    la = len(a)
+    lb = len(b)
+    if la == 0 and lb == 0:
+        return 1.0
+    matches = 0
+    stack = [(0, la, 0, lb)]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        width = bhi - blo
+        besti = alo
+        bestj = blo
+        bestsize = 0
+        prev = [0] * (width + 1)
+        for i in range(alo, ahi):
+            cur = [0] * (width + 1)
+            ca = a[i]
+            for idx in range(width):
+                if ca == b[blo + idx]:
+                    k = prev[idx] + 1
+                    cur[idx + 1] = k
+                    if k > bestsize:
+                        besti = i - k + 1
+                        bestj = blo + idx - k + 1
+                        bestsize = k
+            prev = cur
+        if bestsize > 0:
+            matches += bestsize
+            if besti > alo and bestj > blo:
+                stack.append((alo, besti, blo, bestj))
+            if besti + bestsize < ahi and bestj + bestsize < bhi:
+                stack.append((besti + bestsize, ahi, bestj + bestsize, bhi))
+    return 2.0 * matches / (la + lb)
+
+
+# compile on first use; stays None when numba is absent so callers fall
+# back to difflib
+_njit_ratio = _njit(cache=True)(_ratcliff_obershelp) if _njit is not None else None
+
+# python-Levenshtein is a lighter C extension covering the same ground;
+# use it as a second choice when rapidfuzz is not installed. Its ratio()
+# already returns a float in [0, 1] like difflib.
+try:
+    from Levenshtein import ratio as _lev_ratio
+except ImportError:
+    _lev_ratio = None
+
 KB_FILE = "kb.json"
+KB_LOG = "kb.jsonl"  # append-only log of /add entries since the last /save
 MATCH_THRESHOLD = 0.45  # fuzzy match threshold
 
+# channel weights applied to question/answer/tag similarity scores
+W_Q, W_A, W_T = 1.2, 0.9, 1.0
+
+# precomputed per-channel cutoffs: the minimum raw ratio a channel needs for
+# the weighted score to reach MATCH_THRESHOLD, and reciprocal weights so the
+# inner loop multiplies instead of dividing
+MIN_Q, MIN_A, MIN_T = MATCH_THRESHOLD / W_Q, MATCH_THRESHOLD / W_A, MATCH_THRESHOLD / W_T
+INV_W_Q, INV_W_A, INV_W_T = 1.0 / W_Q, 1.0 / W_A, 1.0 / W_T
+
 DEFAULT_KB = [
     {
         "question": "What is Python used for?",
@@ -55,148 +146,376 @@ DEFAULT_KB = [
 ]
 
 
+# last successfully parsed KB keyed by (path, mtime_ns), so repeated /load
+# on an unchanged file skips the JSON decode
+_KB_CACHE = None
+
+
+def _replay_kb_log(kb, log_path=KB_LOG):
+    # apply entries appended by /add since the last snapshot rewrite
+    if not os.path.exists(log_path):
+        return
+    try:
+        with open(log_path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = orjson.loads(line) if orjson is not None else json.loads(line)
+                if isinstance(item, dict):
+                    kb.append(item)
+    except Exception:
+        pass
+
+
+def _append_kb_log(item, log_path=KB_LOG):
+    # O(1) append per /add instead of rewriting the whole snapshot
+    if orjson is not None:
+        with open(log_path, "ab") as f:
+            f.write(orjson.dumps(item) + b"\n")
+    else:
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
 def load_kb(path=KB_FILE):
+    global _KB_CACHE
     if os.path.exists(path):
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                kb = json.load(f)
-                if isinstance(kb, list):
-                    return kb
+            st = os.stat(path)
+            log_mtime = os.stat(KB_LOG).st_mtime_ns if os.path.exists(KB_LOG) else None
+            if _KB_CACHE is not None and _KB_CACHE[:3] == (path, st.st_mtime_ns, log_mtime):
+                return _KB_CACHE[3]
+            # read the whole file in one go instead of letting the parser
+            # pull it in chunks; both loads() accept utf-8 bytes
+            with open(path, "rb") as f:
+                data = f.read()
+            kb = orjson.loads(data) if orjson is not None else json.loads(data)
+            if isinstance(kb, list):
+                _replay_kb_log(kb)
+                _KB_CACHE = (path, st.st_mtime_ns, log_mtime, kb)
+                return kb
         except Exception:
             pass
-    return DEFAULT_KB.copy()
+    kb = [dict(item) for item in DEFAULT_KB]
+    _replay_kb_log(kb)
+    return kb
 
 
 def save_kb(kb, path=KB_FILE):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(kb, f, indent=2, ensure_ascii=False)
+    # drop cached "_" fields written by older versions so kb.json keeps its
+    # original shape
+    clean = [{k: v for k, v in item.items() if not k.startswith("_")} for item in kb]
+    # serialize first and write in one shot; json.dump streams the encoder
+    # output through many small f.write calls
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(clean, option=orjson.OPT_INDENT_2))
+    else:
+        data = json.dumps(clean, indent=2, ensure_ascii=False)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+    # the snapshot now holds everything, so compact the append log away
+    try:
+        if os.path.exists(KB_LOG):
+            os.remove(KB_LOG)
+    except OSError:
+        pass
+
 
+_WS_RE = re.compile(r"\s+")
 
+
+@functools.lru_cache(maxsize=4096)
 def normalize(text):
-    return " ".join(text.lower().strip().split())
+    # one C-level regex pass instead of the lower/strip/split/join pipeline;
+    # the LRU means repeated queries skip even that
+    return _WS_RE.sub(" ", text.lower()).strip()
+
+
+def _score(a_norm, b_norm):
+    """Score two already-normalized strings with the best available backend."""
+    if _rf_ratio is not None:
+        # rapidfuzz returns a percentage; scale to difflib's [0, 1] range
+        return _rf_ratio(a_norm, b_norm) / 100.0
+    if _lev_ratio is not None:
+        return _lev_ratio(a_norm, b_norm)
+    if _njit_ratio is not None:
+        return _njit_ratio(a_norm, b_norm)
+    return difflib.SequenceMatcher(None, a_norm, b_norm, autojunk=False).ratio()
 
 
 def score_match(query, text):
-    return difflib.SequenceMatcher(None, normalize(query), normalize(text)).ratio()
+    return _score(normalize(query), normalize(text))
+
+
+def build_kb_index(kb):
+    """Build the columnar (SoA) view of the KB used for matching: parallel
+    normalized columns for questions/answers/tags, question token sets for
+    the keyword fallback, a token -> item-indices inverted index, and flat
+    tag columns for batch scoring with rapidfuzz.cdist. The scoring loops
+    walk these lists by index instead of doing dict lookups per item."""
+    tokens = {}
+    qb_col = []
+    ab_col = []
+    tb_items = []
+    qtoks_col = []
+    tb_flat = []
+    tn_owner = []
+    for i, item in enumerate(kb):
+        qn = normalize(item.get("question", ""))
+        an = normalize(item.get("answer", ""))
+        tn = [normalize(t) for t in item.get("tags", [])]
+        # score on ascii bytes: 1-byte elements keep the matchers on their
+        # tight code path versus 4-byte unicode
+        qb_col.append(qn.encode("ascii", "ignore"))
+        ab_col.append(an.encode("ascii", "ignore"))
+        tb_items.append([t.encode("ascii", "ignore") for t in tn])
+        qtoks_col.append(frozenset(qn.split()))
+        for text in (qn, an, *tn):
+            for tok in text.split():
+                tokens.setdefault(tok, set()).add(i)
+        for t in tb_items[i]:
+            tb_flat.append(t)
+            tn_owner.append(i)
+    return {
+        "tokens": tokens,
+        "qb": qb_col,
+        "ab": ab_col,
+        "tb_items": tb_items,
+        "qtoks": qtoks_col,
+        "tb": tb_flat,
+        "tn_owner": tn_owner,
+    }
 
 
-def find_best_answer(kb, query):
+def _score_columns(index, query_b):
+    """Score every KB item against the (normalized, ascii-encoded) query
+    with one rapidfuzz cdist call per column and combine the weighted
+    channels in numpy. Returns the (item_index, combined_score) argmax."""
+    s_q = _rf_process.cdist([query_b], index["qb"], scorer=_rf_ratio, workers=-1)[0]
+    s_a = _rf_process.cdist([query_b], index["ab"], scorer=_rf_ratio, workers=-1)[0]
+    combined = _np.maximum(s_q * (W_Q / 100.0), s_a * (W_A / 100.0))
+    if index["tb"]:
+        s_t = _rf_process.cdist([query_b], index["tb"], scorer=_rf_ratio, workers=-1)[0]
+        # scatter-max each flat tag score back onto its owning item
+        _np.maximum.at(combined, index["tn_owner"], s_t * (W_T / 100.0))
+    i = int(combined.argmax())
+    return i, float(combined[i])
+
+
+def _make_scorer(query_n):
+    # Return a callable scoring the query against one already-normalized text.
+    if _rf_ratio is not None:
+        return lambda text_n, min_score=0.0: (
+            _rf_ratio(query_n, text_n, score_cutoff=min_score * 100.0) / 100.0
+        )
+    if _lev_ratio is not None:
+        return lambda text_n, min_score=0.0: _lev_ratio(query_n, text_n)
+    if _njit_ratio is not None:
+        qlen = len(query_n)
+
+        def score(text_n, min_score=0.0):
+            total = qlen + len(text_n)
+            if total == 0:
+                return 1.0
+            # length-based upper bound, same idea as real_quick_ratio()
+            if 2.0 * min(qlen, len(text_n)) / total < min_score:
+                return 0.0
+            return _njit_ratio(text_n, query_n)
+
+        return score
+    # difflib: reuse one SequenceMatcher with the query as seq2, so its b2j
+    # index is built once and shared across all KB fields. autojunk's
+    # popularity heuristic only costs time on strings this short.
+    sm = difflib.SequenceMatcher(autojunk=False)
+    sm.set_seq2(query_n)
+
+    def score(text_n, min_score=0.0):
+        sm.set_seq1(text_n)
+        # cheap upper bounds on ratio(); skip the full Ratcliff-Obershelp
+        # recursion for candidates that cannot reach min_score
+        if min_score > 0.0 and (
+            sm.real_quick_ratio() < min_score or sm.quick_ratio() < min_score
+        ):
+            return 0.0
+        return sm.ratio()
+
+    return score
+
+
+def find_best_answer(kb, query, index=None):
     query_n = normalize(query)
-    best = None
+    query_b = query_n.encode("ascii", "ignore")
+    if index is None:
+        index = build_kb_index(kb)
+    best_i = -1
     best_score = 0.0
 
-    for item in kb:
-        s_q = score_match(query_n, item["question"])
-        s_a = score_match(query_n, item["answer"])
-        s_t = 0.0
-        if item.get("tags"):
-            s_t = max((score_match(query_n, t) for t in item["tags"]), default=0.0)
-        combined = max(s_q * 1.2, s_a * 0.9, s_t * 1.0)
-        if combined > best_score:
-            best_score = combined
-            best = item
-
-    if best_score >= MATCH_THRESHOLD:
-        return best, best_score
-
-    # fallback: keyword containment in question
-    for item in kb:
-        qn = normalize(item["question"])
-        if any(word for word in query_n.split() if word and word in qn):
-            return item, 0.0
+    if kb and _rf_process is not None and _np is not None:
+        # vectorized path: one native cdist call per column scores the whole
+        # KB, so there is no need for candidate pruning
+        best_i, best_score = _score_columns(index, query_b)
+    else:
+        score = _make_scorer(query_b)
+        qb_col = index["qb"]
+        ab_col = index["ab"]
+        tb_items = index["tb_items"]
+
+        # restrict fuzzy scoring to items sharing at least one token with
+        # the query; fall back to the whole KB when nothing overlaps
+        candidates = range(len(kb))
+        if index["tokens"]:
+            hits = set()
+            token_map = index["tokens"]
+            for word in query_n.split():
+                hits.update(token_map.get(word, ()))
+            if hits:
+                candidates = hits
+
+        for i in candidates:
+            # minimum raw ratio each channel needs to beat best_score or,
+            # failing that, to ever clear MATCH_THRESHOLD
+            need_q = max(MIN_Q, best_score * INV_W_Q)
+            need_a = max(MIN_A, best_score * INV_W_A)
+            need_t = max(MIN_T, best_score * INV_W_T)
+            s_q = score(qb_col[i], need_q)
+            s_a = score(ab_col[i], need_a)
+            s_t = 0.0
+            if tb_items[i]:
+                s_t = max((score(t, need_t) for t in tb_items[i]), default=0.0)
+            combined = max(s_q * W_Q, s_a * W_A, s_t * W_T)
+            if combined > best_score:
+                best_score = combined
+                best_i = i
+
+    if best_i >= 0 and best_score >= MATCH_THRESHOLD:
+        return kb[best_i], best_score
+
+    # fallback: keyword overlap with the question, as a set intersection
+    # against the precomputed question token column
+    query_toks = set(query_n.split())
+    for i, qtoks in enumerate(index["qtoks"]):
+        if query_toks & qtoks:
+            return kb[i], 0.0
 
     return None, best_score
 
 
+# TextWrapper compiles regexes in its constructor; cache instances per
+# (width, indent) instead of rebuilding one per response
+_WRAPPERS = {}
+
+
 def format_wrapped(text, indent=0, width=80):
-    wrapper = textwrap.TextWrapper(width=width - indent)
+    key = (width, indent)
+    wrapper = _WRAPPERS.get(key)
+    if wrapper is None:
+        wrapper = _WRAPPERS.setdefault(key, textwrap.TextWrapper(width=width - indent))
     prefix = " " * indent
-    lines = []
-    for line in wrapper.wrap(text):
-        lines.append(prefix + line)
-    return "\n".join(lines)
+    return "\n".join(prefix + line for line in wrapper.wrap(text))
 
 
 # Maintain KB in module-level variable so handlers can access and modify it
 KB = load_kb()
+KB_INDEX = build_kb_index(KB)
+
+
+async def _cmd_help(arg):
+    help_text = (
+        "Commands:\n"
+        "  /help                       Show this help\n"
+        "  /add Q|A|tag1,tag2          Add new Q/A (use '|' to separate question, answer, tags)\n"
+        "  /list                       List stored Q/A entries\n"
+        "  /save                       Save knowledge base to disk (kb.json)\n"
+        "  /load                       Load knowledge base from disk (overwrites current)\n"
+        "\nExample for /add:\n"
+        "/add What is pytest?|A testing framework for Python.|testing,pytest\n"
+    )
+    await cl.Message(content=help_text).send()
+
+
+async def _cmd_list(arg):
+    if not KB:
+        await cl.Message(content="Knowledge base is empty.").send()
+        return
+    lines = []
+    for i, item in enumerate(KB, 1):
+        tags = ", ".join(item.get("tags", []))
+        lines.append(f"{i}. {item['question']} (tags: {tags})")
+    await cl.Message(content="\n".join(lines)).send()
+
+
+async def _cmd_add(arg):
+    global KB_INDEX
+    if not arg:
+        await cl.Message(content="Usage: /add Question|Answer|tag1,tag2").send()
+        return
+    parts = [p.strip() for p in arg.split("|")]
+    if len(parts) < 2:
+        await cl.Message(content="Please provide at least Question and Answer separated by '|'.").send()
+        return
+    q = parts[0]
+    a = parts[1]
+    tags = []
+    if len(parts) >= 3 and parts[2]:
+        tags = [t.strip() for t in parts[2].split(",") if t.strip()]
+    KB.append({"question": q, "answer": a, "tags": tags})
+    KB_INDEX = build_kb_index(KB)
+    try:
+        _append_kb_log(KB[-1])
+    except Exception:
+        pass
+    await cl.Message(content="Added to knowledge base.").send()
+
+
+async def _cmd_save(arg):
+    try:
+        save_kb(KB)
+        await cl.Message(content=f"Saved KB to {KB_FILE}.").send()
+    except Exception as e:
+        await cl.Message(content=f"Failed to save KB: {e}").send()
+
+
+async def _cmd_load(arg):
+    global KB, KB_INDEX
+    KB = load_kb()
+    KB_INDEX = build_kb_index(KB)
+    await cl.Message(content="Knowledge base loaded.").send()
+
+
+COMMANDS = {
+    "/help": _cmd_help,
+    "/list": _cmd_list,
+    "/add": _cmd_add,
+    "/save": _cmd_save,
+    "/load": _cmd_load,
+}
 
 
 @cl.on_message
 async def handle_message(message: str):
-    global KB
-
     user_text = message.strip()
     if not user_text:
         await cl.Message(content="(empty message)").send()
         return
 
-    # Commands
+    # Commands: single dict lookup instead of a chain of string compares
     if user_text.startswith("/"):
         cmd, *rest = user_text.split(" ", 1)
         arg = rest[0].strip() if rest else ""
-        cmd = cmd.lower()
-
-        if cmd == "/help":
-            help_text = (
-                "Commands:\n"
-                "  /help                       Show this help\n"
-                "  /add Q|A|tag1,tag2          Add new Q/A (use '|' to separate question, answer, tags)\n"
-                "  /list                       List stored Q/A entries\n"
-                "  /save                       Save knowledge base to disk (kb.json)\n"
-                "  /load                       Load knowledge base from disk (overwrites current)\n"
-                "\nExample for /add:\n"
-                "/add What is pytest?|A testing framework for Python.|testing,pytest\n"
-            )
-            await cl.Message(content=help_text).send()
-            return
-
-        if cmd == "/list":
-            if not KB:
-                await cl.Message(content="Knowledge base is empty.").send()
-                return
-            lines = []
-            for i, item in enumerate(KB, 1):
-                tags = ", ".join(item.get("tags", []))
-                lines.append(f"{i}. {item['question']} (tags: {tags})")
-            await cl.Message(content="\n".join(lines)).send()
-            return
-
-        if cmd == "/add":
-            if not arg:
-                await cl.Message(content="Usage: /add Question|Answer|tag1,tag2").send()
-                return
-            parts = [p.strip() for p in arg.split("|")]
-            if len(parts) < 2:
-                await cl.Message(content="Please provide at least Question and Answer separated by '|'.").send()
-                return
-            q = parts[0]
-            a = parts[1]
-            tags = []
-            if len(parts) >= 3 and parts[2]:
-                tags = [t.strip() for t in parts[2].split(",") if t.strip()]
-            KB.append({"question": q, "answer": a, "tags": tags})
-            await cl.Message(content="Added to knowledge base.").send()
-            return
-
-        if cmd == "/save":
-            try:
-                save_kb(KB)
-                await cl.Message(content=f"Saved KB to {KB_FILE}.").send()
-            except Exception as e:
-                await cl.Message(content=f"Failed to save KB: {e}").send()
-            return
-
-        if cmd == "/load":
-            KB = load_kb()
-            await cl.Message(content="Knowledge base loaded.").send()
+        handler = COMMANDS.get(cmd.lower())
+        if handler is not None:
+            await handler(arg)
             return
 
         # unknown command
         await cl.Message(content="Unknown command. Type /help for available commands.").send()
         return
 
-    # Normal query: perform fuzzy retrieval
-    item, score = find_best_answer(KB, user_text)
+    # Normal query: fuzzy retrieval is CPU-bound, so run it in a worker
+    # thread to keep the event loop free for other sessions
+    item, score = await asyncio.to_thread(find_best_answer, KB, user_text, KB_INDEX)
     if item:
         answer = format_wrapped(item["answer"], indent=2)
         if score and score < 0.6: